@@ -4,13 +4,164 @@ Created on 29 juill. 2019
 @author: david.larochelle
 """
 
+import contextlib
 import math
 import os
-from pathlib import Path
-import xml.etree.ElementTree as ET
-from xml.dom import minidom
+import sys
+from array import array
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain, product
+from operator import attrgetter
+from xml.sax.saxutils import escape
 import exifread
 
+_EARTH_RADIUS_IN_METERS = 6378137.0
+_DEG2RAD = math.pi / 180.0  # degrees to radians factor, avoids math.radians() calls
+
+# Image file extensions scanned for exif data (lowercase), as a tuple for str.endswith
+_IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".dng", ".tif", ".tiff", ".png", ".heic", ".heif")
+
+# File name prefixes never scanned: macOS metadata files ("._IMG_0001.jpg")
+_SKIP_PREFIXES = ("._",)
+
+
+# KML document templates, written as-is with tab indentation.
+# Coordinates use 7 decimals, about 1 cm, well beyond GPS accuracy.
+_KML_HEADER = (
+    '<?xml version="1.0" ?>\n'
+    '<kml xmlns="http://www.opengis.net/kml/2.2">\n'
+    "\t<Document>\n"
+    "\t\t<name>{name}</name>\n"
+    "\t\t<description>{description}</description>\n"
+)
+_KML_FOOTER = "\t</Document>\n</kml>\n"
+_KML_FOLDER_HEADER = "\t\t<Folder>\n\t\t\t<name>{name}</name>\n"
+_KML_FOLDER_FOOTER = "\t\t</Folder>\n"
+_KML_PLACEMARK = (
+    "\t\t\t<Placemark>\n"
+    "\t\t\t\t<name>{name}</name>\n"
+    "\t\t\t\t<description>{description}</description>\n"
+    "\t\t\t\t<Point>\n"
+    "\t\t\t\t\t<coordinates>{lon:.7f},{lat:.7f}</coordinates>\n"
+    "\t\t\t\t</Point>\n"
+    "\t\t\t</Placemark>\n"
+)
+_KML_UNNAMED_PLACEMARK = (
+    "\t\t\t<Placemark>\n"
+    "\t\t\t\t<Point>\n"
+    "\t\t\t\t\t<coordinates>{lon:.7f},{lat:.7f}</coordinates>\n"
+    "\t\t\t\t</Point>\n"
+    "\t\t\t</Placemark>\n"
+)
+
+
+def _haversine_in_meters(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """
+    Great-circle distance in meters between two points given in degrees.
+    Reference distance behind Kml._distance_between_placemarks; the placemark filter
+    uses a faster planar approximation instead.
+    """
+    # Each sine is evaluated once and squared, and the result stays in meters.
+    sin_d_lat = math.sin((lat2 - lat1) * (_DEG2RAD / 2))
+    sin_d_lon = math.sin((lon2 - lon1) * (_DEG2RAD / 2))
+    a = sin_d_lat * sin_d_lat + math.cos(lat1 * _DEG2RAD) * math.cos(
+        lat2 * _DEG2RAD
+    ) * (sin_d_lon * sin_d_lon)
+    return 2 * _EARTH_RADIUS_IN_METERS * math.asin(math.sqrt(min(a, 1.0)))
+
+
+def _scandir_recursive(folder: str):
+    """
+    Yields the DirEntry of every file below folder, walking the tree once with os.scandir.
+    Unreadable folders are skipped.
+    """
+    try:
+        entries = os.scandir(folder)
+    except OSError:
+        return
+
+    with entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from _scandir_recursive(entry.path)
+            elif entry.is_file():
+                yield entry
+
+
+def _iter_grid_neighborhood(kept_cells: dict, cell: tuple, nb_columns: int):
+    """
+    Yields the (latitude, longitude) of the placemarks kept in the 3x3 grid cells around
+    cell, a (row, column) key. Columns wrap around the +/-180 meridian.
+    :param kept_cells: parallel (latitudes, longitudes) columns keyed by (row, column)
+    """
+    row, column = cell
+    neighbor_columns = {(column - 1) % nb_columns, column, (column + 1) % nb_columns}
+    for neighbor_cell in product((row - 1, row, row + 1), neighbor_columns):
+        if neighbor_cell in kept_cells:
+            yield from zip(*kept_cells[neighbor_cell])
+
+
+def _is_near(latitude: float, longitude: float, positions, max_d_lat: float) -> bool:
+    """
+    Tells whether any of the (latitude, longitude) positions is closer than max_d_lat
+    degrees of arc to the given position, all in degrees.
+    Positions are compared in a local equirectangular plane scaled by cos(latitude),
+    with longitudes wrapped at +/-180: squared angular distance in degrees against a
+    squared threshold, so each call costs a single cosine and pairs cost no
+    trigonometry at all. Away from the poles this differs from the haversine by well
+    under 1% (under 0.4% up to 85 degrees of latitude for distances up to 10 km). The
+    error grows with tan(latitude) * distance, and reaches tens of percent within a
+    fraction of a degree of the poles.
+    """
+    cos_latitude = math.cos(latitude * _DEG2RAD)
+    max_angle_squared = max_d_lat * max_d_lat
+    for other_latitude, other_longitude in positions:
+        # The latitude gap alone is checked first to skip most distant positions
+        d_lat = other_latitude - latitude
+        if not -max_d_lat < d_lat < max_d_lat:
+            continue
+        d_lon = abs(other_longitude - longitude)
+        if d_lon > 180:
+            d_lon = 360 - d_lon  # shorter way around the +/-180 meridian
+        d_x = d_lon * cos_latitude
+        if d_x * d_x + d_lat * d_lat < max_angle_squared:
+            return True
+    return False
+
+
+class Placemark:
+    """
+    Geotagged image to be exported as a KML placemark.
+    Slots keep each instance small since a scan can hold many thousands of them.
+    """
+
+    __slots__ = ("lat", "lon", "name", "folder", "export")
+
+    def __init__(self, lat: float, lon: float, name: str = "", folder: str = ""):
+        self.lat = lat
+        self.lon = lon
+        self.name = name
+        self.folder = folder
+        self.export = True  # updated by Kml._filter_placemarks
+
+    def __repr__(self):
+        return f"Placemark({self.lat}, {self.lon}, {self.name!r}, {self.folder!r})"
+
+    def __getitem__(self, key: str):
+        # Backward compatibility with the former dict placemarks (my_coord["Latitude"])
+        return getattr(self, _PLACEMARK_KEYS[key])
+
+
+# Former dict placemark keys to Placemark attributes
+_PLACEMARK_KEYS = {
+    "Latitude": "lat",
+    "Longitude": "lon",
+    "Name": "name",
+    "Folder": "folder",
+    "Export": "export",
+}
+
 
 class Kml:
     """
@@ -19,18 +170,17 @@ class Kml:
     For large number of placemarks, a minimum distance can be specified so close placemarks from one another will not be exported.
     """
 
-    # Member variables
-    map_name = ""
-    map_description = ""
-    _placemark_list = []
-    _placemark_list_is_ordered = False
-    min_distance_between_placemarks_in_meters = 0  # minimum distance there as to be from previous point for current placemark to be exported.
-
     def __init__(self, map_name: str):
         """
         Constructor
         """
+        # Member variables, set per instance so placemark lists are never shared
         self.map_name = map_name
+        self.map_description = ""
+        self._placemark_list = []
+        self._placemark_list_is_ordered = False
+        # minimum distance there as to be from previous point for current placemark to be exported.
+        self.min_distance_between_placemarks_in_meters = 0
 
     def __repr__(self):
         return f"KML({self.map_name})"
@@ -49,131 +199,145 @@ class Kml:
         :param folder: (string)
         :rtype: int
         """
-        # Get list of files (case-insensitive extension matching)
-        base_folder = Path(folder)
-
-        # Define valid extensions (case-insensitive)
-        valid_extensions = {
-            ".jpg",
-            ".jpeg",
-            ".dng",
-            ".tif",
-            ".tiff",
-            ".png",
-            ".heic",
-            ".heif",
-        }
-
-        # Get all files recursively and filter by extension (case-insensitive)
-        # Using .suffix.lower() ensures matching works on all platforms (Linux, macOS, Windows)
+        # Walk the tree once and filter by extension (case-insensitive)
+        # Lowering the extension ensures matching works on all platforms (Linux, macOS, Windows)
+        # The folder is normalized first so file names use native separators
+        # (tkinter returns "C:/Photos" on Windows, which would give "C:/Photos\\sub\\img.jpg").
         file_list = [
-            f
-            for f in base_folder.glob("**/*")
-            if f.suffix.lower() in valid_extensions
-            and not f.name.startswith("._")  # exclude macOS metadata files
+            entry.path
+            for entry in _scandir_recursive(os.path.normpath(folder))
+            if not entry.name.startswith(_SKIP_PREFIXES)
+            and entry.name.lower().endswith(_IMAGE_EXTENSIONS)
         ]
 
-        # import os
+        # Exif extraction is I/O bound, read files concurrently.
+        # map() keeps results in file order so placemarks are added deterministically.
         nb_files = 0
-        index = 0
-        for my_file in file_list:
-            # print the index of the file being processed
-            index += 1
-            print(
-                "\tProcessing file: " + str(index) + "/" + str(len(file_list)), end="\r"
-            )
-            try:
-                tags = exifread.process_file(open(str(my_file), "rb"))
-            except (IOError, OSError):  # as e:
-                # print(f"\tCould not read exif from file {my_file}: {e}")
-                continue
-            except TypeError as e:
-                print(f"\tUnexpected error reading exif from file {my_file}: {e}")
-                continue
-
-            try:
-                my_lat = self._convert_to_degress(tags["GPS GPSLatitude"])
-                if tags["GPS GPSLatitudeRef"].values[0] != "N":
-                    my_lat = -my_lat
-                my_lon = self._convert_to_degress(tags["GPS GPSLongitude"])
-                if tags["GPS GPSLongitudeRef"].values[0] != "E":
-                    my_lon = -my_lon
+        max_workers = min(32, (os.cpu_count() or 1) * 4)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            coordinates = executor.map(self._read_gps_coordinates, file_list)
+            for index, (my_file, my_coordinates) in enumerate(
+                zip(file_list, coordinates), start=1
+            ):
+                # print the index of the file being processed
+                print(
+                    "\tProcessing file: " + str(index) + "/" + str(len(file_list)),
+                    end="\r",
+                )
+                if my_coordinates is None:
+                    continue
 
-                self._add_placemark(my_lat, my_lon, str(my_file), folder)
+                my_lat, my_lon = my_coordinates
+                self._add_placemark(my_lat, my_lon, my_file, folder)
                 nb_files += 1
-            except ValueError:
-                # print(f"\tInvalid GPS coordinate in file {my_file}")
-                continue
-            except (KeyError, AttributeError, IndexError):  # as e:
-                # print(f"\tCould not extract GPS info from file {my_file}: {e}")
-                continue
 
         # print(str(nb_files) + "/" + str(len(file_list)) + " files have coordinates in folder " + folder)
         return nb_files
 
+    def _read_gps_coordinates(self, my_file):
+        """
+        Extracts the GPS position from the exif data of an image file.
+        Runs in worker threads from scan_folder, so it must not modify the Kml object.
+        :param my_file: path of the image file
+        :return: (latitude, longitude) in degrees, or None if the file has no usable GPS information
+        """
+        try:
+            # Only the GPS position is needed: skip maker notes and thumbnails, and stop
+            # walking the GPS IFD once GPSLongitude (the last tag used) has been read.
+            with open(my_file, "rb") as image_file:
+                tags = exifread.process_file(
+                    image_file,
+                    stop_tag="GPSLongitude",
+                    details=False,
+                    extract_thumbnail=False,
+                )
+        except (IOError, OSError):  # as e:
+            # print(f"\tCould not read exif from file {my_file}: {e}")
+            return None
+        except TypeError as e:
+            print(f"\tUnexpected error reading exif from file {my_file}: {e}")
+            return None
+
+        try:
+            my_lat = self._convert_to_degress(tags["GPS GPSLatitude"])
+            if tags["GPS GPSLatitudeRef"].values[0] != "N":
+                my_lat = -my_lat
+            my_lon = self._convert_to_degress(tags["GPS GPSLongitude"])
+            if tags["GPS GPSLongitudeRef"].values[0] != "E":
+                my_lon = -my_lon
+        except ValueError:
+            # print(f"\tInvalid GPS coordinate in file {my_file}")
+            return None
+        except (KeyError, AttributeError, IndexError):  # as e:
+            # print(f"\tCould not extract GPS info from file {my_file}: {e}")
+            return None
+
+        return my_lat, my_lon
+
     def _add_placemark(
         self, latitude: float, longitude: float, name: str = "", folder: str = ""
     ):
-        self._placemark_list.append(
-            {
-                "Latitude": latitude,
-                "Longitude": longitude,
-                "Name": name,
-                "Folder": folder,
-            }
-        )
+        # Folder names repeat for every placemark of a folder: interning them shares
+        # one string object, so grouping and folder comparisons hit the identity check.
+        folder = sys.intern(folder)
+        self._placemark_list.append(Placemark(latitude, longitude, name, folder))
 
     def _get_kml_string(self):
-        # create the file structure
-        root = ET.Element("kml")
-        root.set("xmlns", "http://www.opengis.net/kml/2.2")
-        document = ET.SubElement(root, "Document")
-        name = ET.SubElement(document, "name")
-        name.text = self.map_name
-        description = ET.SubElement(document, "description")
-        description.text = self.map_description
+        return "".join(self._iter_kml_chunks())
 
+    def _iter_kml_chunks(self):
+        """
+        Generates the KML document chunk by chunk: header, folder transitions, one chunk
+        per exported placemark and footer.
+        The indented XML is produced directly, no document tree is built in memory.
+        :rtype: Iterator[str]
+        """
         # Sort List prior to export
         self._reorder_placemarks()
 
-        # Create first folder element
-        folder = ET.SubElement(document, "Folder")
-        folder_name = ET.SubElement(folder, "name")
-        folder_name.text = self._placemark_list[0]["Folder"]
+        yield _KML_HEADER.format(
+            name=escape(self.map_name), description=escape(self.map_description)
+        )
+
+        # Images of a folder mostly share the same directory: its escaped description is
+        # reused until the directory changes, so each placemark escapes only its file name.
+        format_placemark = _KML_PLACEMARK.format
+        format_unnamed_placemark = _KML_UNNAMED_PLACEMARK.format
+        file_path = description = None
 
+        folder_name = None
         nb_files_to_export = 0
         for my_coord in self._placemark_list:
-            if my_coord["Folder"] != folder_name.text:
+            my_folder = my_coord.folder
+            if my_folder != folder_name:
                 # Create new folder if different
-                folder = ET.SubElement(document, "Folder")
-                folder_name = ET.SubElement(folder, "name")
-                folder_name.text = my_coord["Folder"]
-
-            if my_coord["Export"]:
-                my_placemark = ET.SubElement(folder, "Placemark")
-                if my_coord["Name"] != "":
-                    file_path, file_name = os.path.split(my_coord["Name"])
-                    my_name = ET.SubElement(my_placemark, "name")
-                    my_name.text = file_name
-                    my_desc = ET.SubElement(my_placemark, "description")
-                    my_desc.text = file_path
-
-                my_point = ET.SubElement(my_placemark, "Point")
-                my_coordinate = ET.SubElement(my_point, "coordinates")
-                my_coordinate.text = (
-                    str(my_coord["Longitude"]) + "," + str(my_coord["Latitude"])
-                )
+                if folder_name is not None:
+                    yield _KML_FOLDER_FOOTER
+                folder_name = my_folder
+                yield _KML_FOLDER_HEADER.format(name=escape(folder_name))
+
+            if my_coord.export:
+                my_name = my_coord.name
+                if my_name != "":
+                    my_path, file_name = os.path.split(my_name)
+                    if my_path != file_path:
+                        file_path = my_path
+                        description = escape(file_path)
+                    yield format_placemark(
+                        name=escape(file_name),
+                        description=description,
+                        lon=my_coord.lon,
+                        lat=my_coord.lat,
+                    )
+                else:
+                    yield format_unnamed_placemark(lon=my_coord.lon, lat=my_coord.lat)
                 nb_files_to_export += 1
 
-        print(str(nb_files_to_export) + " placemarks exported to KML.")
+        if folder_name is not None:
+            yield _KML_FOLDER_FOOTER
+        yield _KML_FOOTER
 
-        # create a new XML file with the results
-        xml_string = ET.tostring(root, encoding="unicode")
-        try:
-            xml_string = minidom.parseString(xml_string).toprettyxml()
-        except (ValueError, TypeError) as e:
-            print(f"Problems converting to Pretty XML (minidom): {e}")
-        return xml_string
+        print(str(nb_files_to_export) + " placemarks exported to KML.")
 
     def save_kml_file(self, path: str):
         """
@@ -181,13 +345,21 @@ class Kml:
         :param path: The file path where the KML will be saved
         :return: True if successful, False otherwise
         """
-        kml_string = self._get_kml_string()
+        # The KML is generated into a temporary file next to the target, which only
+        # replaces the target once complete: an error while generating never leaves a
+        # truncated KML behind.
+        temp_path = path + ".tmp"
         try:
-            with open(path, "w", encoding="utf-8") as my_file:
-                my_file.write(kml_string)
+            # Large buffer since the KML is written in many small chunks
+            with open(temp_path, "w", encoding="utf-8", buffering=1 << 20) as my_file:
+                my_file.writelines(self._iter_kml_chunks())
+            os.replace(temp_path, path)
         except (IOError, OSError) as e:
             print(f"\tCould not save KML file: {e}")
             return False
+        finally:
+            with contextlib.suppress(OSError):
+                os.remove(temp_path)  # left over only if something failed
 
         return True
 
@@ -196,9 +368,18 @@ class Kml:
         Sorts list based on Folder and latitude
         """
         # Sort List in order to calculate distance between points.
-        self._placemark_list = sorted(
-            self._placemark_list, key=lambda i: (i["Folder"], i["Latitude"])
-        )
+        # Group by folder first so the sort itself only compares latitudes (floats)
+        # instead of folder strings, then concatenate the folders in order.
+        folders = defaultdict(list)
+        for my_coord in self._placemark_list:
+            folders[my_coord.folder].append(my_coord)
+
+        by_latitude = attrgetter("lat")
+        self._placemark_list = []
+        for folder in sorted(folders):
+            folder_placemarks = folders[folder]
+            folder_placemarks.sort(key=by_latitude)
+            self._placemark_list.extend(folder_placemarks)
         self._filter_placemarks()  # recalculate placemarks to be exported
 
     def _filter_placemarks(self):
@@ -213,27 +394,72 @@ class Kml:
             + " meters."
         )
 
-        kept_coords = []
+        min_distance = self.min_distance_between_placemarks_in_meters
+        if min_distance <= 0:
+            # No filtering: every placemark is exported, no distance to compute
+            for my_coord in self._placemark_list:
+                my_coord.export = True
+            export_count = len(self._placemark_list)
+            print(
+                "\t"
+                + str(export_count)
+                + " placemarks marked to export out of "
+                + str(export_count)
+            )
+            return export_count
+
+        cell_height, cell_width, nb_columns = self._get_grid_cell_size(min_distance)
+
+        # Largest latitude gap, in degrees, between two placemarks closer than
+        # min_distance (see _is_near for the planar comparison and its accuracy)
+        if min_distance < math.pi * _EARTH_RADIUS_IN_METERS:
+            max_d_lat = math.degrees(min_distance / _EARTH_RADIUS_IN_METERS)
+        else:
+            max_d_lat = math.inf
+
+        # Kept placemarks are bucketed in a lat/lon grid so each candidate is only
+        # compared with kept placemarks of the 3x3 neighboring cells.
+        # Each cell holds parallel columns (latitude, longitude) of packed doubles.
+        kept_cells = defaultdict(lambda: (array("d"), array("d")))
 
+        # Burst photos often share the exact same position: a placemark at an already
+        # seen position gets the same outcome as the first one, which is to be skipped
+        # (either it was kept, at distance 0, or something kept was already too close).
+        seen_positions = set()
+
+        last_kept = (math.inf, math.inf)
         export_count = 0
         for my_coord in self._placemark_list:
-            my_coord["Export"] = True
-            for kept_coord in kept_coords:
-                if (
-                    self._distance_between_placemarks(
-                        my_coord["Latitude"],
-                        my_coord["Longitude"],
-                        kept_coord["Latitude"],
-                        kept_coord["Longitude"],
-                    )
-                    < self.min_distance_between_placemarks_in_meters
-                ):
-                    my_coord["Export"] = False
-                    break
+            latitude = my_coord.lat
+            longitude = my_coord.lon
+            if (latitude, longitude) in seen_positions:
+                my_coord.export = False
+                continue
+            seen_positions.add((latitude, longitude))
+
+            cell = (
+                math.floor(latitude / cell_height),
+                math.floor((longitude + 180) / cell_width) % nb_columns,
+            )
+
+            # Placemarks are sorted by latitude within a folder, so the last kept one is
+            # usually the closest: it is compared first, and the grid neighborhood is
+            # only looked up (lazily) when it is far enough.
+            my_coord.export = not _is_near(
+                latitude,
+                longitude,
+                chain(
+                    (last_kept,), _iter_grid_neighborhood(kept_cells, cell, nb_columns)
+                ),
+                max_d_lat,
+            )
 
-            if my_coord["Export"] is True:
+            if my_coord.export is True:
                 export_count += 1
-                kept_coords.append(my_coord)
+                kept_cell = kept_cells[cell]
+                kept_cell[0].append(latitude)
+                kept_cell[1].append(longitude)
+                last_kept = (latitude, longitude)
 
         print(
             "\t"
@@ -243,6 +469,30 @@ class Kml:
         )
         return export_count
 
+    def _get_grid_cell_size(self, min_distance: float):
+        """
+        Computes the size in degrees of the grid cells used to bucket placemarks while filtering.
+        Cells are large enough that two placemarks closer than min_distance are always in the same or in adjacent cells.
+        :param min_distance: distance in meters
+        :return: (cell height in degrees, cell width in degrees, number of columns around the globe)
+        """
+        angle = min_distance / _EARTH_RADIUS_IN_METERS  # radians
+        if angle <= 0 or angle >= math.pi:
+            # No usable bound, use a single cell
+            return 180.0, 360.0, 1
+
+        # Longitude span is widest for the placemark closest to a pole
+        max_latitude = max(
+            map(abs, map(attrgetter("lat"), self._placemark_list)), default=0.0
+        )
+        min_width = angle / math.cos(math.radians(max_latitude))
+        if min_width >= math.pi:
+            return math.degrees(angle), 360.0, 1
+
+        # Use a whole number of columns so the grid wraps cleanly at +/-180 degrees
+        nb_columns = max(1, int(360 / math.degrees(min_width)))
+        return math.degrees(angle), 360.0 / nb_columns, nb_columns
+
     def _convert_to_degress(self, ratio) -> float:
         """
         Helper function to convert the GPS coordinates stored in the EXIF to degress in float format
@@ -250,25 +500,19 @@ class Kml:
         :type value: exifread.utils.Ratio
         :rtype: float
         """
+        # True division of the integer ratios already yields floats, and the
+        # sexagesimal sum is evaluated in Horner form: d + (m + s / 60) / 60.
+        d, m, s = ratio.values[:3]
         # Try and catch divide by zero error
         try:
-            d = float(ratio.values[0].num) / float(ratio.values[0].den)
-            m = float(ratio.values[1].num) / float(ratio.values[1].den)
-            s = float(ratio.values[2].num) / float(ratio.values[2].den)
+            if d.den == m.den == s.den == 1:
+                # Whole degrees, minutes and seconds: no ratio to divide
+                return d.num + (m.num + s.num / 60.0) / 60.0
+            return d.num / d.den + (m.num / m.den + s.num / s.den / 60.0) / 60.0
         except ZeroDivisionError as e:
             raise ValueError("Invalid GPS coordinate with zero denominator") from e
 
-        return d + (m / 60.0) + (s / 3600.0)
-
     def _distance_between_placemarks(
         self, lat1: float, lon1: float, lat2: float, lon2: float
     ) -> float:
-        radius = 6378.137  # // Radius of earth in KM
-        d_lat = lat2 * math.pi / 180 - lat1 * math.pi / 180
-        d_lon = lon2 * math.pi / 180 - lon1 * math.pi / 180
-        a = math.sin(d_lat / 2) * math.sin(d_lat / 2) + math.cos(
-            lat1 * math.pi / 180
-        ) * math.cos(lat2 * math.pi / 180) * math.sin(d_lon / 2) * math.sin(d_lon / 2)
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-        d = radius * c
-        return d * 1000  # // meters
+        return _haversine_in_meters(lat1, lon1, lat2, lon2)
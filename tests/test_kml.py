@@ -31,15 +31,27 @@ Why use mocking?
     - Tests focus on the logic being tested, not on external systems
 """
 
+import random
 import unittest
 from unittest.mock import patch, mock_open, MagicMock
 import tempfile
+import time
 import os
 from pathlib import Path
 import xml.etree.ElementTree as ET
 from kml import Kml
 
 
+def _dir_entries(*paths):
+    """Builds os.DirEntry stand-ins for the given file paths"""
+    entries = []
+    for path in paths:
+        entry = MagicMock(path=path)
+        entry.name = os.path.basename(path)
+        entries.append(entry)
+    return entries
+
+
 class TestKmlInit(unittest.TestCase):
     """Test Kml class initialization"""
 
@@ -51,6 +63,14 @@ class TestKmlInit(unittest.TestCase):
         self.assertEqual(len(kml._placemark_list), 0)
         self.assertEqual(kml.min_distance_between_placemarks_in_meters, 0)
 
+    def test_instances_do_not_share_placemarks(self):
+        """Test that each Kml instance has its own placemark list"""
+        first = Kml("First Map")
+        second = Kml("Second Map")
+        first._add_placemark(45.5, -73.5, "Test", "/folder")
+        self.assertEqual(len(first._placemark_list), 1)
+        self.assertEqual(len(second._placemark_list), 0)
+
     def test_repr(self):
         """Test __repr__ method"""
         kml = Kml("Test Map")
@@ -73,10 +93,21 @@ class TestKmlAddPlacemark(unittest.TestCase):
         """Test adding a basic placemark"""
         self.kml._add_placemark(45.5, -73.5, "Test", "/test/folder")
         self.assertEqual(len(self.kml._placemark_list), 1)
-        self.assertEqual(self.kml._placemark_list[0]["Latitude"], 45.5)
-        self.assertEqual(self.kml._placemark_list[0]["Longitude"], -73.5)
-        self.assertEqual(self.kml._placemark_list[0]["Name"], "Test")
-        self.assertEqual(self.kml._placemark_list[0]["Folder"], "/test/folder")
+        self.assertEqual(self.kml._placemark_list[0].lat, 45.5)
+        self.assertEqual(self.kml._placemark_list[0].lon, -73.5)
+        self.assertEqual(self.kml._placemark_list[0].name, "Test")
+        self.assertEqual(self.kml._placemark_list[0].folder, "/test/folder")
+
+    def test_placemark_legacy_keys(self):
+        """Test that placemarks can still be read with the former dict keys"""
+        self.kml._add_placemark(45.5, -73.5, "Test", "/test/folder")
+        placemark = self.kml._placemark_list[0]
+        self.assertEqual(placemark["Latitude"], 45.5)
+        self.assertEqual(placemark["Longitude"], -73.5)
+        self.assertEqual(placemark["Name"], "Test")
+        self.assertEqual(placemark["Folder"], "/test/folder")
+        self.assertTrue(placemark["Export"])
+        self.assertRaises(KeyError, placemark.__getitem__, "Altitude")
 
     def test_add_multiple_placemarks(self):
         """Test adding multiple placemarks"""
@@ -84,6 +115,13 @@ class TestKmlAddPlacemark(unittest.TestCase):
         self.kml._add_placemark(46.5, -74.5, "Test2", "/folder2")
         self.assertEqual(len(self.kml._placemark_list), 2)
 
+    def test_add_placemark_shares_folder_strings(self):
+        """Test that placemarks of the same folder share a single folder string"""
+        self.kml._add_placemark(45.5, -73.5, "Test1", "".join(["/test", "/folder"]))
+        self.kml._add_placemark(46.5, -74.5, "Test2", "".join(["/test/", "folder"]))
+        first, second = self.kml._placemark_list
+        self.assertIs(first.folder, second.folder)
+
 
 class TestKmlConvertToDegrees(unittest.TestCase):
     """Test GPS coordinate conversion"""
@@ -122,6 +160,31 @@ class TestKmlConvertToDegrees(unittest.TestCase):
         # 45 + (30/60) + (36/3600) = 45.51
         self.assertAlmostEqual(result, 45.51, places=5)
 
+    def test_convert_to_degrees_with_fractional_seconds(self):
+        """Test conversion when the ratios have non-unit denominators"""
+        mock_ratio = MagicMock()
+        mock_ratio.values = [
+            MagicMock(num=45, den=1),  # degrees
+            MagicMock(num=61, den=2),  # 30.5 minutes
+            MagicMock(num=1234, den=100),  # 12.34 seconds
+        ]
+
+        result = self.kml._convert_to_degress(mock_ratio)
+        # 45 + (30.5/60) + (12.34/3600)
+        self.assertAlmostEqual(result, 45.5117611, places=7)
+
+    def test_convert_to_degrees_zero_denominator(self):
+        """Test that a zero denominator is reported as an invalid coordinate"""
+        mock_ratio = MagicMock()
+        mock_ratio.values = [
+            MagicMock(num=45, den=1),  # degrees
+            MagicMock(num=30, den=0),  # minutes
+            MagicMock(num=0, den=1),  # seconds
+        ]
+
+        with self.assertRaises(ValueError):
+            self.kml._convert_to_degress(mock_ratio)
+
 
 class TestKmlDistanceBetweenPlacemarks(unittest.TestCase):
     """Test distance calculation between placemarks"""
@@ -170,10 +233,10 @@ class TestKmlReorderAndFilterPlacemarks(unittest.TestCase):
         self.kml._reorder_placemarks()
 
         # Should be sorted by folder then latitude
-        self.assertEqual(self.kml._placemark_list[0]["Name"], "Point1")
-        self.assertEqual(self.kml._placemark_list[1]["Name"], "Point2")
-        self.assertEqual(self.kml._placemark_list[2]["Name"], "Point3")
-        self.assertEqual(self.kml._placemark_list[3]["Name"], "Point4")
+        self.assertEqual(self.kml._placemark_list[0].name, "Point1")
+        self.assertEqual(self.kml._placemark_list[1].name, "Point2")
+        self.assertEqual(self.kml._placemark_list[2].name, "Point3")
+        self.assertEqual(self.kml._placemark_list[3].name, "Point4")
 
     def test_filter_placemarks_no_minimum_distance(self):
         """Test filtering with no minimum distance - all should be exported"""
@@ -186,7 +249,20 @@ class TestKmlReorderAndFilterPlacemarks(unittest.TestCase):
 
         self.assertEqual(count, 3)
         for placemark in self.kml._placemark_list:
-            self.assertTrue(placemark["Export"])
+            self.assertTrue(placemark.export)
+
+    def test_filter_placemarks_no_minimum_distance_resets_export(self):
+        """Test that removing the minimum distance exports filtered placemarks again"""
+        self.kml._add_placemark(45.5, -73.5, "Point1", "/folder")
+        self.kml._add_placemark(45.5, -73.5, "Point2", "/folder")
+
+        self.kml.min_distance_between_placemarks_in_meters = 50
+        self.assertEqual(self.kml._filter_placemarks(), 1)
+
+        self.kml.min_distance_between_placemarks_in_meters = 0
+        self.assertEqual(self.kml._filter_placemarks(), 2)
+        for placemark in self.kml._placemark_list:
+            self.assertTrue(placemark.export)
 
     def test_filter_placemarks_with_minimum_distance(self):
         """Test filtering with minimum distance - some should be filtered"""
@@ -201,9 +277,52 @@ class TestKmlReorderAndFilterPlacemarks(unittest.TestCase):
         self.kml._reorder_placemarks()
 
         # Point1 and Point3 should be exported, Point2 should not
-        self.assertTrue(self.kml._placemark_list[0]["Export"])
-        self.assertFalse(self.kml._placemark_list[1]["Export"])
-        self.assertTrue(self.kml._placemark_list[2]["Export"])
+        self.assertTrue(self.kml._placemark_list[0].export)
+        self.assertFalse(self.kml._placemark_list[1].export)
+        self.assertTrue(self.kml._placemark_list[2].export)
+
+    def test_filter_placemarks_skips_identical_positions(self):
+        """Test that placemarks at an already seen position are not exported"""
+        self.kml._add_placemark(45.5, -73.5, "Point1", "/folderA")
+        self.kml._add_placemark(45.5, -73.5, "Point2", "/folderA")
+        self.kml._add_placemark(45.5, -73.5, "Point3", "/folderB")
+        self.kml._add_placemark(45.6, -73.5, "Point4", "/folderB")
+
+        self.kml.min_distance_between_placemarks_in_meters = 10
+        self.kml._reorder_placemarks()
+
+        exported = [i.name for i in self.kml._placemark_list if i.export]
+        self.assertEqual(exported, ["Point1", "Point4"])
+
+    def test_filter_placemarks_respects_minimum_distance(self):
+        """Test that exported placemarks are spaced out and skipped ones have a close exported neighbor"""
+        rng = random.Random(42)
+        for index in range(300):
+            self.kml._add_placemark(
+                rng.uniform(45.0, 45.2),
+                rng.choice([-73.5, 179.95, -179.95]) + rng.uniform(-0.04, 0.04),
+                f"Point{index}",
+                rng.choice(["/folderA", "/folderB"]),
+            )
+        self.kml.min_distance_between_placemarks_in_meters = 1500
+        self.kml._reorder_placemarks()
+
+        # The filter uses a planar approximation, allow 0.5% around the threshold
+        kept = []
+        for placemark in self.kml._placemark_list:
+            distances = [
+                self.kml._distance_between_placemarks(
+                    placemark.lat, placemark.lon, other.lat, other.lon
+                )
+                for other in kept
+            ]
+            if placemark.export:
+                self.assertTrue(all(d >= 1500 * 0.995 for d in distances))
+                kept.append(placemark)
+            else:
+                self.assertTrue(any(d < 1500 * 1.005 for d in distances))
+        self.assertGreater(len(kept), 10)
+        self.assertLess(len(kept), 300)
 
 
 class TestKmlGetKmlString(unittest.TestCase):
@@ -238,8 +357,8 @@ class TestKmlGetKmlString(unittest.TestCase):
 
         kml_string = self.kml._get_kml_string()
 
-        # Coordinates should be longitude,latitude
-        self.assertIn("-73.5,45.5", kml_string)
+        # Coordinates should be longitude,latitude with 7 decimals
+        self.assertIn("-73.5000000,45.5000000", kml_string)
 
     def test_get_kml_string_multiple_folders(self):
         """Test KML with multiple folders"""
@@ -266,6 +385,48 @@ class TestKmlGetKmlString(unittest.TestCase):
         # Only one placemark should be in the output
         self.assertEqual(kml_string.count("<Placemark>"), 1)
 
+    def test_get_kml_string_is_indented(self):
+        """Test that the KML is pretty-printed with one element per line"""
+        self.kml._add_placemark(45.5, -73.5, "/folder/test.jpg", "/folder")
+
+        lines = self.kml._get_kml_string().splitlines()
+
+        self.assertEqual(lines[0], '<?xml version="1.0" ?>')
+        self.assertIn("\t\t<Folder>", lines)
+        self.assertIn("\t\t\t<Placemark>", lines)
+        self.assertIn(
+            "\t\t\t\t\t<coordinates>-73.5000000,45.5000000</coordinates>", lines
+        )
+        self.assertEqual(lines[-1], "</kml>")
+
+    def test_get_kml_string_escapes_special_characters(self):
+        """Test that names with XML special characters produce valid XML"""
+        self.kml.map_name = "Trips & <Hikes>"
+        self.kml._add_placemark(45.5, -73.5, "/folder/a&b.jpg", "/folder")
+
+        kml_string = self.kml._get_kml_string()
+
+        root = ET.fromstring(kml_string)
+        namespace = "{http://www.opengis.net/kml/2.2}"
+        self.assertEqual(
+            root.find(f"{namespace}Document/{namespace}name").text,
+            "Trips & <Hikes>",
+        )
+        self.assertIn("<name>a&amp;b.jpg</name>", kml_string)
+
+    def test_get_kml_string_descriptions_follow_subfolders(self):
+        """Test that each placemark is described by its own subfolder"""
+        self.kml._add_placemark(45.5, -73.5, "/folder/a&b/test1.jpg", "/folder")
+        self.kml._add_placemark(45.6, -73.5, "/folder/a&b/test2.jpg", "/folder")
+        self.kml._add_placemark(45.7, -73.5, "/folder/c/test3.jpg", "/folder")
+
+        kml_string = self.kml._get_kml_string()
+
+        self.assertEqual(
+            kml_string.count("<description>/folder/a&amp;b</description>"), 2
+        )
+        self.assertEqual(kml_string.count("<description>/folder/c</description>"), 1)
+
 
 class TestKmlSaveFile(unittest.TestCase):
     """Test saving KML to file"""
@@ -290,6 +451,19 @@ class TestKmlSaveFile(unittest.TestCase):
                 self.assertIn("<?xml", content)
                 self.assertIn("<kml", content)
 
+    def test_save_kml_file_keeps_existing_file_on_error(self):
+        """Test that a failure while generating the KML leaves an existing file intact"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            file_path = os.path.join(tmpdir, "test.kml")
+            Path(file_path).write_text("previous", encoding="utf-8")
+
+            self.kml.map_name = None
+            with self.assertRaises(AttributeError):
+                self.kml.save_kml_file(file_path)
+
+            self.assertEqual(Path(file_path).read_text(encoding="utf-8"), "previous")
+            self.assertEqual(os.listdir(tmpdir), ["test.kml"])
+
     def test_save_kml_file_invalid_path(self):
         """Test saving to invalid path"""
         result = self.kml.save_kml_file("/invalid/path/that/does/not/exist/test.kml")
@@ -307,20 +481,20 @@ class TestKmlScanFolder(unittest.TestCase):
     # The corresponding mock arguments are passed to the test method from right to left
     # 1. @patch("exifread.process_file") → mock_exif (rightmost parameter)
     # 2. @patch("builtins.open", ...) → mock_file (middle parameter)
-    # 3. @patch("pathlib.Path.glob") → mock_glob (leftmost parameter)
+    # 3. @patch("kml._scandir_recursive") → mock_scandir (leftmost parameter)
     #
     # This allows us to test scan_folder() without:
     # - Actually reading files from disk (builtins.open is mocked)
     # - Processing real EXIF data (exifread.process_file is mocked)
-    # - Scanning real directories (pathlib.Path.glob is mocked)
-    @patch("pathlib.Path.glob")
+    # - Scanning real directories (kml._scandir_recursive is mocked)
+    @patch("kml._scandir_recursive")
     @patch("builtins.open", new_callable=mock_open)
     @patch("exifread.process_file")
-    def test_scan_folder_with_gps_data(self, mock_exif, mock_file, mock_glob):
+    def test_scan_folder_with_gps_data(self, mock_exif, mock_file, mock_scandir):
         """Test scanning folder with images containing GPS data"""
-        # Setup mock files: Configure what Path.glob() should return
+        # Setup mock files: Configure which directory entries the folder walk yields
         # This simulates finding two image files in the directory
-        mock_glob.return_value = [Path("/test/image1.jpg"), Path("/test/image2.jpg")]
+        mock_scandir.return_value = _dir_entries("/test/image1.jpg", "/test/image2.jpg")
 
         # Setup mock EXIF data: Create a dictionary structure that mimics real exifread output
         # MagicMock objects simulate the nested structure of GPS coordinates:
@@ -349,17 +523,15 @@ class TestKmlScanFolder(unittest.TestCase):
 
         result = self.kml.scan_folder("/test")
 
-        self.assertEqual(
-            result, 6
-        )  # mock will not allow filtering for different file types.
-        self.assertEqual(len(self.kml._placemark_list), 6)
+        self.assertEqual(result, 2)
+        self.assertEqual(len(self.kml._placemark_list), 2)
 
-    @patch("pathlib.Path.glob")
+    @patch("kml._scandir_recursive")
     @patch("builtins.open", new_callable=mock_open)
     @patch("exifread.process_file")
-    def test_scan_folder_without_gps_data(self, mock_exif, mock_file, mock_glob):
+    def test_scan_folder_without_gps_data(self, mock_exif, mock_file, mock_scandir):
         """Test scanning folder with images without GPS data"""
-        mock_glob.return_value = [Path("/test/image1.jpg")]
+        mock_scandir.return_value = _dir_entries("/test/image1.jpg")
         # Return empty dict to simulate images with no EXIF GPS data
         # This tests that the code handles missing GPS data gracefully
         mock_exif.return_value = {}  # No GPS data
@@ -369,28 +541,120 @@ class TestKmlScanFolder(unittest.TestCase):
         self.assertEqual(result, 0)
         self.assertEqual(len(self.kml._placemark_list), 0)
 
-    @patch("pathlib.Path.glob")
-    def test_scan_folder_excludes_metadata_files(self, mock_glob):
+    @patch("kml._scandir_recursive")
+    @patch("builtins.open", new_callable=mock_open)
+    @patch("exifread.process_file", return_value={})
+    def test_scan_folder_reads_only_gps_tags(self, mock_exif, mock_file, mock_scandir):
+        """Test that exifread is asked to skip maker notes and stop after the GPS tags"""
+        mock_scandir.return_value = _dir_entries("/test/image1.jpg")
+
+        self.kml.scan_folder("/test")
+
+        mock_file.assert_called_once_with("/test/image1.jpg", "rb")
+        _, kwargs = mock_exif.call_args
+        self.assertEqual(kwargs["stop_tag"], "GPSLongitude")
+        self.assertFalse(kwargs["details"])
+        self.assertFalse(kwargs["extract_thumbnail"])
+
+    @patch("kml._scandir_recursive")
+    def test_scan_folder_excludes_metadata_files(self, mock_scandir):
         """Test that macOS metadata files are excluded"""
-        mock_glob.return_value = [Path("/test/._metadata.jpg"), Path("/test/image.jpg")]
+        mock_scandir.return_value = _dir_entries(
+            "/test/._metadata.jpg", "/test/image.jpg"
+        )
 
         with patch("builtins.open", mock_open()), patch(
             "exifread.process_file", return_value={}
-        ):
+        ) as mock_exif:
             result = self.kml.scan_folder("/test")
 
         # Only non-metadata files should be processed
         # (both will return 0 since no GPS data, but metadata file should be skipped)
         self.assertEqual(len(self.kml._placemark_list), 0)
+        self.assertEqual(mock_exif.call_count, 1)
+
+    def test_scan_folder_walks_subfolders(self):
+        """Test that image files are found recursively with case-insensitive extensions"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            os.makedirs(os.path.join(tmpdir, "sub", "deeper"))
+            for name in (
+                "image1.jpg",
+                os.path.join("sub", "IMAGE2.JPG"),
+                os.path.join("sub", "deeper", "image3.dng"),
+                os.path.join("sub", "notes.txt"),
+                os.path.join("sub", "._image4.jpg"),
+            ):
+                Path(tmpdir, name).touch()
+
+            with patch.object(Kml, "_read_gps_coordinates", return_value=(45.5, -73.5)):
+                result = self.kml.scan_folder(tmpdir)
+
+        self.assertEqual(result, 3)
+        names = sorted(os.path.basename(i.name) for i in self.kml._placemark_list)
+        self.assertEqual(names, ["IMAGE2.JPG", "image1.jpg", "image3.dng"])
+
+    def test_scan_folder_normalizes_file_names(self):
+        """Test that file names are normalized whatever the form of the scanned folder"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            os.makedirs(os.path.join(tmpdir, "sub"))
+            Path(tmpdir, "sub", "image.jpg").touch()
+
+            with patch.object(Kml, "_read_gps_coordinates", return_value=(45.5, -73.5)):
+                self.kml.scan_folder(os.path.join(tmpdir, ".", "sub", ""))
+
+            self.assertEqual(
+                self.kml._placemark_list[0].name,
+                os.path.join(tmpdir, "sub", "image.jpg"),
+            )
+
+    @patch("kml._scandir_recursive")
+    def test_scan_folder_keeps_file_order(self, mock_scandir):
+        """Test that placemarks follow file order even when reads finish out of order"""
+        paths = [f"/test/image{index}.jpg" for index in range(8)]
+        mock_scandir.return_value = _dir_entries(*paths)
+
+        def read_gps(my_file):
+            index = paths.index(my_file)
+            time.sleep(0.01 * (len(paths) - index))  # first files finish last
+            return 45.0 + index, -73.5
+
+        with patch.object(self.kml, "_read_gps_coordinates", side_effect=read_gps):
+            result = self.kml.scan_folder("/test")
+
+        self.assertEqual(result, len(paths))
+        self.assertEqual([i.name for i in self.kml._placemark_list], paths)
+
+    def test_scan_folder_missing_folder(self):
+        """Test that a folder that cannot be listed is skipped"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            result = self.kml.scan_folder(os.path.join(tmpdir, "missing"))
+
+        self.assertEqual(result, 0)
+
+    @unittest.skipIf(not hasattr(os, "symlink"), "symlinks not supported")
+    def test_scan_folder_does_not_follow_folder_symlinks(self):
+        """Test that a symlink back to a parent folder does not loop forever"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            os.makedirs(os.path.join(tmpdir, "sub"))
+            Path(tmpdir, "sub", "image1.jpg").touch()
+            try:
+                os.symlink(tmpdir, os.path.join(tmpdir, "sub", "loop"))
+            except OSError:
+                self.skipTest("cannot create symlinks")
+
+            with patch.object(Kml, "_read_gps_coordinates", return_value=(45.5, -73.5)):
+                result = self.kml.scan_folder(tmpdir)
+
+        self.assertEqual(result, 1)
 
     # @patch with side_effect: Simulates exceptions/errors
     # Instead of returning a value, side_effect makes the mock raise an exception
     # This tests error handling without needing to corrupt actual files
-    @patch("pathlib.Path.glob")
+    @patch("kml._scandir_recursive")
     @patch("builtins.open", side_effect=IOError("Cannot read file"))
-    def test_scan_folder_handles_io_errors(self, mock_file, mock_glob):
+    def test_scan_folder_handles_io_errors(self, mock_file, mock_scandir):
         """Test that IO errors are handled gracefully"""
-        mock_glob.return_value = [Path("/test/image1.jpg")]
+        mock_scandir.return_value = _dir_entries("/test/image1.jpg")
 
         result = self.kml.scan_folder("/test")
 